@@ -0,0 +1,174 @@
+# CPython + NumPy (на ПК, не для MicroPython!)
+# mail: goctaprog@gmail.com
+# MIT license
+"""Компилятор светового шоу для PCA9685.
+
+Преобразует временную шкалу яркостей (массив NumPy формы (кадры, каналы), значения 0.0..1.0)
+в потоки образов регистров, по одному потоку на каждый контроллер. Все вычисления векторные,
+без цикла Python по кадрам. Поток проигрывается на устройстве методом Pca9685.play_frame.
+
+Формат потока (little endian):
+    заголовок, 12 байт: b"P9F", версия(B), адрес устройства(B), резерв(x), период кадра в мс(H), кол-во кадров(I)
+    кадр: кол-во участков(B), далее для каждого участка:
+        первый выход участка(B), кол-во выходов(B), затем по 4 байта на выход: LEDx_ON(H), LEDx_OFF(H).
+    Участок - непрерывная последовательность выходов, значения регистров которых изменились по сравнению с
+    предыдущим кадром. В первом кадре записываются все выходы, назначенные каналам шоу."""
+import struct
+import numpy as np
+
+_bit_12 = 0b1_0000_0000_0000
+_ticks = 4096
+_leds = 16
+# должны совпадать с константами потока в pca9685mod.py!
+_stream_magic = b"P9F"
+_stream_version = 1
+_stream_header_fmt = "<3sBBxHI"
+
+
+def apply_curve(frames: np.ndarray, curve=None) -> np.ndarray:
+    """Применяет кривую яркости к кадрам frames со значениями 0.0..1.0.
+    curve может быть:
+        None - без преобразования,
+        число (int, float или скаляр NumPy) - показатель степени (гамма), например 2.2,
+        одномерный массив - таблица, равномерно заданная на отрезке 0.0..1.0 (линейная интерполяция),
+        двумерный массив формы (каналы, N) - отдельная таблица для каждого канала."""
+    src = np.clip(np.asarray(frames, dtype=np.float32), 0.0, 1.0)
+    if curve is None:
+        return src
+    if 0 == np.ndim(curve):     # число Python или скаляр NumPy
+        return src ** np.float32(curve)
+    lut = np.asarray(curve, dtype=np.float32)
+    if 1 == lut.ndim:
+        xp = np.linspace(0.0, 1.0, lut.shape[0])
+        return np.interp(src, xp, lut)
+    if 2 == lut.ndim and lut.shape[0] == src.shape[1] and lut.shape[1] >= 2:
+        # индекс в таблице каждого канала и линейная интерполяция между соседними точками
+        n = lut.shape[1] - 1
+        pos = src * n
+        lo = np.minimum(pos.astype(np.intp), n - 1)
+        frac = pos - lo
+        ch = np.arange(src.shape[1])
+        return lut[ch, lo] * (1.0 - frac) + lut[ch, lo + 1] * frac
+    raise ValueError(f"Неверная форма кривой яркости: {lut.shape}")
+
+
+def quantize(frames: np.ndarray, phase=None) -> tuple:
+    """Преобразует яркости 0.0..1.0 в значения регистров (LEDx_ON, LEDx_OFF), массивы uint16 той же формы.
+    phase - задержка включения каждого канала в тиках 0..4095 (число или массив формы (каналы,)).
+    Разнесение моментов включения каналов уменьшает броски тока потребления нагрузки.
+    Яркость 1.0 устанавливает бит full on, яркость 0 устанавливает бит full off."""
+    duty = np.rint(np.clip(frames, 0.0, 1.0) * _ticks).astype(np.int32)
+    if phase is None:
+        phase = 0
+    ph = np.broadcast_to(np.asarray(phase, dtype=np.int32) & (_ticks - 1), duty.shape)
+    on = ph.copy()
+    off = (ph + duty) & (_ticks - 1)
+    full_on = duty >= _ticks
+    full_off = 0 == duty
+    on[full_on] = _bit_12
+    off[full_on] = 0
+    on[full_off] = 0
+    off[full_off] = _bit_12
+    return on.astype(np.uint16), off.astype(np.uint16)
+
+
+def _pack_chip(on: np.ndarray, off: np.ndarray, used: np.ndarray) -> bytes:
+    """Упаковывает кадры одного контроллера в последовательность кадров потока (без заголовка).
+    on, off - массивы формы (кадры, 16); used - маска выходов, назначенных каналам шоу, форма (16,)."""
+    frames = on.shape[0]
+    word = on.astype(np.uint32) | (off.astype(np.uint32) << 16)
+    dirty = np.empty((frames, _leds), dtype=bool)
+    dirty[0] = used
+    dirty[1:] = (word[1:] != word[:-1]) & used
+    # начало и конец участков изменившихся выходов
+    prev = np.zeros_like(dirty)
+    prev[:, 1:] = dirty[:, :-1]
+    nxt = np.zeros_like(dirty)
+    nxt[:, :-1] = dirty[:, 1:]
+    starts = dirty & ~prev
+    ends = dirty & ~nxt
+    runs_per_frame = starts.sum(axis=1)
+    dirty_per_frame = dirty.sum(axis=1)
+    frame_size = 1 + 2 * runs_per_frame + 4 * dirty_per_frame
+    frame_off = np.zeros(frames, dtype=np.int64)
+    np.cumsum(frame_size[:-1], out=frame_off[1:])
+    out = np.zeros(int(frame_size.sum()), dtype=np.uint8)
+    out[frame_off] = runs_per_frame
+    # количество изменившихся выходов перед данным выходом в кадре
+    dirty_before = np.cumsum(dirty, axis=1) - dirty
+    # номер участка (с 1) данного выхода в кадре
+    run_no = np.cumsum(starts, axis=1)
+    # заголовки участков
+    fr_s, ch_s = np.nonzero(starts)
+    _, ch_e = np.nonzero(ends)
+    pos = frame_off[fr_s] + 1 + 2 * (run_no[fr_s, ch_s] - 1) + 4 * dirty_before[fr_s, ch_s]
+    out[pos] = ch_s
+    out[pos + 1] = ch_e - ch_s + 1
+    # значения регистров
+    fr_d, ch_d = np.nonzero(dirty)
+    pos = frame_off[fr_d] + 1 + 2 * run_no[fr_d, ch_d] + 4 * dirty_before[fr_d, ch_d]
+    on_d = on[fr_d, ch_d]
+    off_d = off[fr_d, ch_d]
+    out[pos] = on_d & 0xFF
+    out[pos + 1] = on_d >> 8
+    out[pos + 2] = off_d & 0xFF
+    out[pos + 3] = off_d >> 8
+    return out.tobytes()
+
+
+def compile_show(frames: np.ndarray, mapping, curve=None, phase=None, frame_period: int = 33) -> dict:
+    """Компилирует световое шоу в потоки образов регистров.
+    frames - массив формы (кадры, каналы), яркости 0.0..1.0.
+    mapping - последовательность пар (адрес устройства на шине, индекс выхода 0..15), по одной на канал шоу.
+    curve - кривая яркости, смотри apply_curve.
+    phase - задержка включения каналов в тиках, смотри quantize.
+    frame_period - период кадра в мс, записывается в заголовок потока.
+    Возвращает словарь: адрес устройства -> поток (bytes), готовый к записи в файл.
+    Кадры обрабатываются по контроллерам (по 16 каналов), поэтому расход памяти на промежуточные массивы
+    не зависит от общего количества каналов шоу."""
+    src = np.asarray(frames)
+    if 2 != src.ndim:
+        raise ValueError(f"Неверная форма массива кадров: {src.shape}")
+    n_frames, n_channels = src.shape
+    if len(mapping) != n_channels:
+        raise ValueError(f"Количество каналов ({n_channels}) не равно длине mapping ({len(mapping)})")
+    if n_frames < 1 or n_frames >= 2 ** 32:
+        raise ValueError(f"Неверное количество кадров: {n_frames}")
+    if frame_period not in range(1, 0x10000):
+        raise ValueError(f"Неверное значение периода кадра: {frame_period}")
+    addr = np.array([item[0] for item in mapping], dtype=np.int32)
+    led = np.array([item[1] for item in mapping], dtype=np.int32)
+    if np.any((addr < 0x40) | (addr > 0x7F)):
+        raise ValueError("Неверное значение адреса I2C устройства в mapping!")
+    if np.any((led < 0) | (led >= _leds)):
+        raise ValueError("Неверный индекс выхода в mapping!")
+    slot = addr * _leds + led
+    if np.unique(slot).shape[0] != slot.shape[0]:
+        raise ValueError("Один выход устройства назначен нескольким каналам!")
+
+    # кривые и задержки, заданные для каждого канала, выбираются по столбцам контроллера
+    lut = None if curve is None or 0 == np.ndim(curve) else np.asarray(curve)
+    per_channel_curve = lut is not None and 2 == lut.ndim
+    if per_channel_curve and lut.shape[0] != n_channels:
+        raise ValueError(f"Неверная форма кривой яркости: {lut.shape}")
+    ph = None if phase is None else np.asarray(phase)
+    per_channel_phase = ph is not None and ph.ndim > 0
+    if per_channel_phase and ph.shape != (n_channels,):
+        raise ValueError(f"Неверная форма массива задержек: {ph.shape}")
+
+    result = dict()
+    for address in np.unique(addr):
+        cols = np.flatnonzero(addr == address)
+        chip_curve = lut[cols] if per_channel_curve else curve
+        chip_phase = ph[cols] if per_channel_phase else phase
+        on, off = quantize(apply_curve(src[:, cols], chip_curve), chip_phase)
+        chip_on = np.zeros((n_frames, _leds), dtype=np.uint16)
+        chip_off = np.full((n_frames, _leds), _bit_12, dtype=np.uint16)     # не назначенные выходы выключены
+        chip_on[:, led[cols]] = on
+        chip_off[:, led[cols]] = off
+        used = np.zeros(_leds, dtype=bool)
+        used[led[cols]] = True
+        header = struct.pack(_stream_header_fmt, _stream_magic, _stream_version, int(address),
+                             frame_period, n_frames)
+        result[int(address)] = header + _pack_chip(chip_on, chip_off, used)
+    return result
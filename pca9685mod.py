@@ -5,11 +5,22 @@ from sensor_pack import bus_service
 from sensor_pack.base_sensor import Device, Iterator, check_value, all_none
 import time
 from micropython import const
-from struct import pack_into
+from struct import pack_into, unpack
 
 _bit_12 = const(0b1_0000_0000_0000)
 _bit_0_11 = const(0b1111_1111_1111)
 _ticks = const(4096)
+# поток кадров, подготовленный pca9685compiler.py на ПК
+_stream_magic = b"P9F"
+_stream_version = const(1)
+_stream_header_fmt = "<3sBBxHI"
+_stream_header_size = const(12)
+# снимок состояния: b"P9S", версия(B), регистры MODE1..LED15_OFF_H (0x00..0x45), PRE_SCALE (0xFE)
+_snapshot_magic = b"P9S"
+_snapshot_version = const(1)
+_snapshot_header_size = const(4)
+_snapshot_regs = const(0x46)
+_snapshot_size = const(0x4B)
 
 
 def _check_id_subaddr(id_sub_addr: int):
@@ -19,12 +30,13 @@ def _check_id_subaddr(id_sub_addr: int):
     check_value(id_sub_addr, range(4), err_info)
 
 
-def _get_on_off(pwm_duty_cycle: int) -> tuple:
+def get_on_off(pwm_duty_cycle: int) -> tuple:
     """Возвращает значения регистров ШИМ канала по коэффициенту заполнения ШИМ в процентах 0..100"""
-    check_value(pwm_duty_cycle, range(101), f"Неверное значение pwm_duty_cycle: {pwm_duty_cycle}")
+    # без создания объектов (range, строка сообщения, float), пока значение верное
+    if not isinstance(pwm_duty_cycle, int) or not 0 <= pwm_duty_cycle <= 100:
+        raise ValueError(f"Неверное значение pwm_duty_cycle: {pwm_duty_cycle}")
     on_delay = 0
-    tmp = 0.01 * (_ticks - 1)
-    off_delay = on_delay + int(pwm_duty_cycle * tmp)
+    off_delay = on_delay + pwm_duty_cycle * (_ticks - 1) // 100
     #       on delay    off delay, full on, full off
     return on_delay, off_delay, 100 == pwm_duty_cycle, 0 == pwm_duty_cycle
 
@@ -32,7 +44,7 @@ def _get_on_off(pwm_duty_cycle: int) -> tuple:
 def get_duty_cycle(on_delay: int, off_delay: int) -> int:
     """Возвращает коэффициент заполнения ШИМ в процентах 0..100 по значениям регистров ШИМ канала"""
     res = int(100 * (off_delay - on_delay) / _ticks)
-    # print(f"DBG: _get_on_off: {on_delay}\t{off_delay}\tduty_cycle: {res}")
+    # print(f"DBG: get_on_off: {on_delay}\t{off_delay}\tduty_cycle: {res}")
     return res
 
 
@@ -44,6 +56,51 @@ def get_prescaler(pwm_freq: int, clock_frequency: int = 25_000_000) -> int:
     return int(round(2 ** -12 * clock_frequency / pwm_freq - 1, 0))
 
 
+def pack_out(buf, offset: int, on_val: int, off_val: int, full_on: bool, full_off: bool, byte_order: str = "<"):
+    """Пакует пару значений регистров (LEDx_ON, LEDx_OFF) одного выхода в буфер buf, 4 байта, начиная с offset.
+    Если full_on или full_off в Истина, устанавливается бит 12 соответствующего регистра.
+    byte_order - '<' или '>', как второй элемент Device._get_byteorder_as_str()."""
+    _on_val, _off_val = on_val, off_val
+    if full_on:
+        _on_val = _bit_12
+    if full_off:
+        _off_val = _bit_12
+    pack_into("<HH" if "<" == byte_order else ">HH", buf, offset, _on_val, _off_val)
+
+
+def read_stream_header(stream) -> tuple:
+    """Читает заголовок потока кадров, подготовленного pca9685compiler.py.
+    Возвращает кортеж: (адрес устройства на шине, период кадра в мс, количество кадров)."""
+    raw = stream.read(_stream_header_size)
+    if raw is None or _stream_header_size != len(raw):
+        raise ValueError("Неполный заголовок потока кадров!")
+    magic, version, address, frame_period, frames = unpack(_stream_header_fmt, raw)
+    if _stream_magic != magic or _stream_version != version:
+        raise ValueError(f"Неверный формат потока кадров: {magic}, версия: {version}")
+    return address, frame_period, frames
+
+
+def _check_snapshot(snapshot: [bytes, bytearray]):
+    """Проверяет снимок состояния, полученный методом Pca9685.snapshot, до записи в устройство.
+    Возбуждает ValueError, если снимок поврежден."""
+    if _snapshot_size != len(snapshot):
+        raise ValueError(f"Неверный размер снимка: {len(snapshot)}")
+    if _snapshot_magic != snapshot[:3] or _snapshot_version != snapshot[3]:
+        raise ValueError(f"Неверный формат снимка: {bytes(snapshot[:3])}, версия: {snapshot[3]}")
+    regs = _snapshot_header_size
+    if snapshot[regs + 1] & 0b1110_0000:
+        raise ValueError(f"Установлены зарезервированные биты MODE2: {snapshot[regs + 1]:x}")
+    for addr in range(2, 6):
+        if snapshot[regs + addr] & 0x01:
+            raise ValueError(f"Установлен зарезервированный бит 0 регистра {addr:x}")
+    for addr in range(7, _snapshot_regs, 2):
+        if snapshot[regs + addr] & 0b1110_0000:
+            raise ValueError(f"Установлены зарезервированные биты регистра {addr:x}")
+    pre_scale = snapshot[regs + _snapshot_regs]
+    if pre_scale < 3:
+        raise ValueError(f"Неверное значение предделителя: {pre_scale}")
+
+
 def _get_led_address(index: [int, None]) -> tuple:
     """возвращает адреса регистров выходов в виде кортежа: (LEDxx_ON, LEDxx_OFF).
     Каждый регистр двухбайтный!!!"""
@@ -66,6 +123,7 @@ class Pca9685(Device, Iterator):
         # включаю внутреннее тактирование, автоинкремент адреса, нормальный рабочий режим
         self._mode_1(None, False, True, False)
         self._buf_4 = bytearray((0 for _ in range(4)))  # для _read_buf_from_mem
+        self._frame_buf = None  # для play_frame, создается при первом вызове
 
     def _read_reg(self, reg_addr, bytes_count=2) -> bytes:
         """считывает из регистра датчика значение.
@@ -253,17 +311,10 @@ class Pca9685(Device, Iterator):
         full_on - если истина, то требуется ВКлючить СИД на 100 % периода ШИМ!
         full_off - если истина, то требуется ВЫключить СИД  на 100 % периода ШИМ!
         """
-        _on_val, _off_val = on_val, off_val
-        if full_on:
-            _on_val = _bit_12
-        if full_off:
-            _off_val = _bit_12
-
         on_addr, _ = _get_led_address(index)
         buf = self._buf_4
-        _format = f"{self._get_byteorder_as_str()[1]}HH"
         # пакую в буфер
-        pack_into(_format, buf, 0, _on_val, _off_val)
+        pack_out(buf, 0, on_val, off_val, full_on, full_off, self._get_byteorder_as_str()[1])
         self._write_buf_to_mem(on_addr, buf)
 
     def _get_out(self, index: int) -> tuple:
@@ -293,9 +344,89 @@ class Pca9685(Device, Iterator):
         return get_duty_cycle(on, off)
 
     def _set_out_duty_cycle(self, index: [int, None], duty_cycle: int):
-        on, off, full_on, full_off = _get_on_off(duty_cycle)
+        on, off, full_on, full_off = get_on_off(duty_cycle)
         self._set_out(index, on, off, full_on, full_off)
 
+    def write_out_image(self, first: int, buf):
+        """Записывает образ регистров (LEDx_ON, LEDx_OFF) нескольких подряд идущих выходов одной посылкой
+        по шине, начиная с выхода first, 0..15. На каждый выход приходится 4 байта буфера buf (little endian).
+        Значения в buf записываются как есть, включая биты full on/full off!"""
+        cnt = len(buf)
+        if 0 == cnt:
+            return
+        if cnt % 4 or first + cnt // 4 > len(self):
+            raise ValueError(f"Неверный размер образа регистров: {cnt} байт, начиная с выхода {first}")
+        on_addr, _ = _get_led_address(first)
+        self._write_buf_to_mem(on_addr, buf)
+
+    def play_frame(self, stream) -> bool:
+        """Читает из потока stream один кадр, подготовленный pca9685compiler.py, и записывает его в устройство.
+        Каждый участок изменившихся выходов кадра записывается одной посылкой по шине.
+        Заголовок потока должен быть прочитан заранее функцией read_stream_header.
+        Возвращает Ложь, если поток закончился."""
+        if self._frame_buf is None:
+            self._frame_buf = bytearray(4 * len(self))
+        mv = memoryview(self._frame_buf)
+        hdr = self._buf_4
+        if 1 != stream.readinto(mv[:1]):
+            return False    # конец потока
+        runs = mv[0]
+        for _ in range(runs):
+            # первый выход участка, количество выходов
+            if 2 != stream.readinto(memoryview(hdr)[:2]):
+                raise ValueError("Неполный кадр: нет заголовка участка!")
+            first, cnt = hdr[0], hdr[1]
+            if 0 == cnt or first + cnt > len(self):
+                raise ValueError(f"Неверный участок кадра: первый выход {first}, количество выходов {cnt}")
+            part = mv[:4 * cnt]
+            if 4 * cnt != stream.readinto(part):
+                raise ValueError(f"Неполный кадр: участок с выхода {first}, количество выходов {cnt}")
+            self.write_out_image(first, part)
+        return True
+
+    def snapshot(self) -> bytes:
+        """Возвращает снимок состояния контроллера (75 байт): заголовок b"P9S", версия и регистры MODE1, MODE2,
+        SUBADR1..3, ALLCALLADR, LED0..15 и PRE_SCALE. Регистры считываются пакетными чтениями по шине.
+        Если автоинкремент адреса выключен, он включается на время чтения, затем MODE1 восстанавливается.
+        Снимок - обычный объект bytes, его можно записать в файл и позже передать в restore."""
+        buf = bytearray(_snapshot_size)
+        buf[:3] = _snapshot_magic
+        buf[3] = _snapshot_version
+        mv = memoryview(buf)[_snapshot_header_size:]
+        mode_1 = self._read_reg(0x00, 1)[0]
+        ai_off = 0 == 0b0010_0000 & mode_1
+        if ai_off:
+            # без автоинкремента адреса пакетное чтение вернет только MODE1
+            self._write_reg(0x00, mode_1 | 0b0010_0000, 1)
+        try:
+            self._read_buf_from_mem(0x00, mv[:_snapshot_regs])
+        finally:
+            if ai_off:
+                self._write_reg(0x00, mode_1, 1)
+        mv[0] = mode_1
+        self._read_buf_from_mem(0xFE, mv[_snapshot_regs:])
+        return bytes(buf)
+
+    def restore(self, snapshot: [bytes, bytearray]):
+        """Восстанавливает состояние контроллера из снимка, полученного методом snapshot.
+        Например, после сброса микросхемы или пропадания питания. Порядок записи:
+        MODE1 (сон, автоинкремент), одной посылкой MODE2..LED15, PRE_SCALE (только в режиме сна!),
+        MODE1 из снимка. Бит RESTART не записывается, все регистры выходов уже записаны.
+        Снимок проверяется до первой записи по шине, поврежденный снимок не изменяет состояние устройства."""
+        _check_snapshot(snapshot)
+        snapshot = memoryview(snapshot)[_snapshot_header_size:]
+        mode_1 = snapshot[0] & 0x7F     # без RESTART
+        sleep_ai = 0b0011_0000 | (mode_1 & 0b0100_0000)  # сон, автоинкремент и EXTCLK из снимка
+        if mode_1 & 0b0100_0000:
+            # EXTCLK можно установить только после перехода в режим сна
+            self._write_reg(0x00, 0b0011_0000, 1)
+        self._write_reg(0x00, sleep_ai, 1)
+        self._write_buf_to_mem(0x01, snapshot[1:_snapshot_regs])
+        self._pre_scaler(snapshot[_snapshot_regs])
+        self._write_reg(0x00, mode_1, 1)
+        if 0 == 0b0001_0000 & mode_1:
+            time.sleep_us(500)  # выход из режима сна
+
     def __getitem__(self, key: [int, range, slice, None]) -> [int, tuple]:
         """возврат значения времени включенного состояния канала(ов) в % от периода ШИМ по его индексу или диапазону.
         key может иметь тип: int(0..15), range, slice, None.
@@ -373,3 +504,4 @@ class Pca9685(Device, Iterator):
 
     def __del__(self):
         del self._buf_4
+        del self._frame_buf
@@ -0,0 +1,228 @@
+# micropython
+# mail: goctaprog@gmail.com
+# MIT license
+"""Конвейер вывода кадров: кадр готовится в одном потоке (ядре), а записывается в PCA9685 по шине - в другом.
+На Raspberry Pi Pico (RP2040) поток, созданный _thread.start_new_thread, выполняется на втором ядре.
+MicroPython на RP2040 разрешает только один такой поток, поэтому один конвейер обслуживает все контроллеры."""
+import _thread
+from micropython import const
+from pca9685mod import get_on_off, pack_out
+
+# что делать, когда предыдущий кадр еще не отправлен, а готов следующий
+POLICY_WAIT = const(0)      # ждать отправки предыдущего кадра
+POLICY_DROP = const(1)      # отбросить новый кадр
+POLICY_LATEST = const(2)    # заменить неотправленный кадр новым (неотправленный пропускается)
+
+
+class _Frame:
+    """Образы регистров выходов всех контроллеров кадра и, для каждого контроллера,
+    диапазон выходов [lo, hi], изменившихся с предыдущего отправленного кадра."""
+
+    def __init__(self, chips: int, leds: int):
+        self.leds = leds
+        self.images = [bytearray(4 * leds) for _ in range(chips)]
+        self.lo = [leds] * chips
+        self.hi = [-1] * chips
+
+    def clean(self):
+        """Нет изменившихся выходов"""
+        for chip in range(len(self.lo)):
+            self.lo[chip] = self.leds
+            self.hi[chip] = -1
+
+    def mark(self, chip: int, index: int):
+        """Выход index контроллера chip изменился"""
+        if index < self.lo[chip]:
+            self.lo[chip] = index
+        if index > self.hi[chip]:
+            self.hi[chip] = index
+
+    def merge(self, other):
+        """Добавляет изменившиеся выходы кадра other"""
+        for chip in range(len(self.lo)):
+            if other.lo[chip] < self.lo[chip]:
+                self.lo[chip] = other.lo[chip]
+            if other.hi[chip] > self.hi[chip]:
+                self.hi[chip] = other.hi[chip]
+
+    def copy_images(self, other):
+        for dst, src in zip(self.images, other.images):
+            dst[:] = src
+
+
+class OutputPipeline:
+    """Тройная буферизация образов регистров выходов нескольких контроллеров с передачей по шине в отдельном потоке:
+    задний кадр заполняет производитель, готовый кадр ждет отправки, передний кадр отправляет рабочий поток.
+    Производитель заполняет задний кадр методами set_out/set_raw и вызывает submit().
+    Потоки ждут друг друга на блокировках, без опроса в цикле.
+    Рабочий поток записывает готовый кадр во все контроллеры: в каждый - одной посылкой по шине, только участок
+    от первого до последнего изменившегося выхода. После start() и до stop() обращаться к контроллерам
+    (и к их шинам!) из других потоков нельзя!"""
+
+    def __init__(self, controllers, policy: int = POLICY_LATEST):
+        """controllers - последовательность объектов Pca9685, номер контроллера в ней - параметр chip
+        методов set_out, set_raw."""
+        if policy not in (POLICY_WAIT, POLICY_DROP, POLICY_LATEST):
+            raise ValueError(f"Неверное значение policy: {policy}")
+        self._controllers = tuple(controllers)
+        if not self._controllers:
+            raise ValueError("Нет контроллеров!")
+        self._policy = policy
+        chips, leds = len(self._controllers), len(self._controllers[0])
+        self._back = _Frame(chips, leds)    # заполняется производителем
+        self._ready = _Frame(chips, leds)   # готов к отправке
+        self._front = _Frame(chips, leds)   # отправляется рабочим потоком
+        self._tmp = bytearray(4)
+        for chip in range(chips):
+            for index in range(leds):
+                self.set_raw(chip, index, 0, 0, False, True)     # все выходы выключены
+        self._lock = _thread.allocate_lock()    # защищает _ready, _pending, _running
+        self._signal = _thread.allocate_lock()  # свободен, когда есть кадр для отправки или запрошена остановка
+        self._signal.acquire()
+        self._taken = _thread.allocate_lock()   # свободен, когда рабочий поток забрал готовый кадр
+        self._taken.acquire()
+        self._done = _thread.allocate_lock()    # захвачен, пока работает рабочий поток
+        self._pending = False
+        self._running = False
+        self._stopped = True
+        self.error = None   # исключение, остановившее рабочий поток
+        # статистика
+        self.submitted = 0
+        self.sent = 0
+        self.dropped = 0
+        self.skipped = 0
+
+    def __len__(self) -> int:
+        return len(self._controllers)
+
+    def set_raw(self, chip: int, index: int, on_val: int, off_val: int, full_on: bool = False,
+                full_off: bool = False):
+        """Устанавливает значения регистров (LEDx_ON, LEDx_OFF) выхода index, 0..15, контроллера chip
+        в заднем кадре. Смысл параметров как у Pca9685._set_out.
+        Вызывается для каждого выхода каждого кадра, поэтому не создает объектов в куче (нет работы для сборщика
+        мусора, который на RP2040 останавливает и рабочий поток на втором ядре)."""
+        back = self._back
+        if not 0 <= chip < len(back.images):
+            raise ValueError(f"Неверный номер контроллера: {chip}")
+        if not 0 <= index < back.leds:
+            raise ValueError(f"Неверный индекс СИД: {index}")
+        tmp = self._tmp
+        pack_out(tmp, 0, on_val, off_val, full_on, full_off)
+        offs = 4 * index
+        image = back.images[chip]
+        if tmp[0] != image[offs] or tmp[1] != image[offs + 1] or tmp[2] != image[offs + 2] \
+                or tmp[3] != image[offs + 3]:
+            pack_out(image, offs, on_val, off_val, full_on, full_off)
+            back.mark(chip, index)
+
+    def set_out(self, chip: int, index: int, duty_cycle: int):
+        """Устанавливает коэффициент заполнения ШИМ выхода index, 0..15, контроллера chip, в процентах 0..100,
+        в заднем кадре"""
+        self.set_raw(chip, index, *get_on_off(duty_cycle))
+
+    def _notify(self):
+        """Будит рабочий поток. Вызывать при захваченном _lock!"""
+        if self._signal.locked():
+            self._signal.release()
+
+    def _notify_taken(self):
+        """Будит производителя, ждущего в submit (POLICY_WAIT). Вызывать при захваченном _lock!"""
+        if self._taken.locked():
+            self._taken.release()
+
+    def submit(self) -> bool:
+        """Передает заполненный задний кадр на отправку. Содержимое кадра остается в заднем кадре,
+        поэтому следующий кадр можно готовить, изменяя только нужные выходы.
+        Возвращает Ложь, если кадр отброшен (POLICY_DROP)."""
+        while True:
+            self._lock.acquire()
+            try:
+                if not self._running:
+                    raise RuntimeError(f"Конвейер не запущен! {self.error}")
+                if self._pending:
+                    if POLICY_DROP == self._policy:
+                        # изменения остаются в заднем кадре и уйдут со следующим
+                        self.dropped += 1
+                        return False
+                    if POLICY_LATEST == self._policy:
+                        # изменения неотправленного кадра уйдут с новым
+                        self._back.merge(self._ready)
+                        self.skipped += 1
+                        self._pending = False
+                    if self._pending:   # POLICY_WAIT
+                        self._taken.acquire(0)  # сброс сигнала, оставшегося от прошлых кадров
+                if not self._pending:
+                    self._back, self._ready = self._ready, self._back
+                    self._back.copy_images(self._ready)
+                    self._back.clean()
+                    self._pending = True
+                    self.submitted += 1
+                    self._notify()
+                    return True
+            finally:
+                self._lock.release()
+            self._taken.acquire()   # POLICY_WAIT, ожидание, пока рабочий поток заберет готовый кадр
+
+    def _send(self, frame: _Frame):
+        """Записывает изменившиеся выходы кадра во все контроллеры"""
+        for chip, controller in enumerate(self._controllers):
+            lo, hi = frame.lo[chip], frame.hi[chip]
+            if lo <= hi:
+                controller.write_out_image(lo, memoryview(frame.images[chip])[4 * lo:4 * (hi + 1)])
+
+    def _worker(self):
+        try:
+            while True:
+                self._signal.acquire()
+                self._lock.acquire()
+                try:
+                    if self._pending:
+                        self._front, self._ready = self._ready, self._front
+                        self._pending = False
+                        self._notify_taken()
+                        got = True
+                    else:
+                        got = False
+                    running = self._running
+                finally:
+                    self._lock.release()
+                if got:
+                    self._send(self._front)
+                    self.sent += 1
+                if not running:
+                    break
+        except Exception as e:
+            self.error = e
+        finally:
+            self._lock.acquire()
+            try:
+                self._running = False
+                self._stopped = True
+                self._notify_taken()    # производитель в submit увидит остановку
+            finally:
+                self._lock.release()
+            self._done.release()
+
+    def start(self):
+        """Запускает рабочий поток"""
+        if not self._stopped:
+            raise RuntimeError("Конвейер уже запущен!")
+        self.error = None
+        self._running = True
+        self._stopped = False
+        self._done.acquire()
+        _thread.start_new_thread(self._worker, ())
+
+    def stop(self):
+        """Отправляет последний готовый кадр и останавливает рабочий поток.
+        Если рабочий поток остановлен ошибкой, возбуждает RuntimeError с этой ошибкой."""
+        self._lock.acquire()
+        try:
+            self._running = False
+            self._notify()
+        finally:
+            self._lock.release()
+        self._done.acquire()    # ожидание завершения рабочего потока
+        self._done.release()
+        if self.error is not None:
+            raise RuntimeError(f"Ошибка при записи кадра: {self.error}") from self.error
@@ -0,0 +1,205 @@
+# CPython (на ПК, не для MicroPython!)
+# mail: goctaprog@gmail.com
+# MIT license
+"""Анализ трассы обмена по шине, записанной pca9685trace.TracingAdapter.
+
+Трасса проигрывается на модели регистров устройств и модели стоимости шины I2C.
+В отчете: количество транзакций, байт, оценка времени занятости шины и избыточные записи
+(запись в регистры тех же значений, что в них уже находятся)."""
+import struct
+from collections import namedtuple
+
+# должны совпадать с константами в pca9685trace.py!
+OP_WRITE_REGISTER = 1
+OP_READ_REGISTER = 2
+OP_WRITE_BUF = 3
+OP_READ_BUF = 4
+_rec_fmt = "<IBBBxH"
+_rec_header_size = 10
+_trace_magic = b"P9T"
+_trace_version = 2
+_trace_header_fmt = "<3sBHII"
+_trace_header_size = 14
+
+_op_names = {OP_WRITE_REGISTER: "write_register", OP_READ_REGISTER: "read_register",
+             OP_WRITE_BUF: "write_buf_to_mem", OP_READ_BUF: "read_buf_from_mem"}
+
+# dt - время от предыдущей записи трассы, мкс. 0 у первой записи после паузы (TracingAdapter.enabled = False)
+TraceRecord = namedtuple("TraceRecord", "dt op address reg length payload")
+
+
+def is_write(op: int) -> bool:
+    return op in (OP_WRITE_REGISTER, OP_WRITE_BUF)
+
+
+def load_trace(data: bytes) -> tuple:
+    """Разбирает трассу, возвращенную TracingAdapter.dump().
+    Возвращает кортеж: (список TraceRecord, количество потерянных на устройстве записей).
+    payload записи может быть короче length, если данные были обрезаны при записи трассы!"""
+    if len(data) < _trace_header_size:
+        raise ValueError(f"Неполный заголовок трассы: {len(data)} байт")
+    magic, version, payload_cap, count, dropped = struct.unpack_from(_trace_header_fmt, data, 0)
+    if _trace_magic != magic or _trace_version != version:
+        raise ValueError(f"Неверный формат трассы: {magic}, версия: {version}")
+    rec_size = _rec_header_size + payload_cap
+    if len(data) != _trace_header_size + count * rec_size:
+        raise ValueError(f"Неверный размер трассы: {len(data)} байт")
+    records = list()
+    for offs in range(_trace_header_size, len(data), rec_size):
+        dt, op, address, reg, length = struct.unpack_from(_rec_fmt, data, offs)
+        start = offs + _rec_header_size
+        payload = data[start:start + min(length, payload_cap)]
+        records.append(TraceRecord(dt, op, address, reg, length, payload))
+    return records, dropped
+
+
+class BusCostModel:
+    """Модель стоимости транзакций шины I2C.
+    freq - частота шины, Гц.
+    overhead_us - программные накладные расходы на одну транзакцию, мкс."""
+
+    def __init__(self, freq: int = 400_000, overhead_us: float = 0.0):
+        self.freq = freq
+        self.overhead_us = overhead_us
+
+    @staticmethod
+    def bus_bytes(op: int, length: int) -> int:
+        """Количество байт на шине, включая адрес устройства и адрес регистра"""
+        if is_write(op):
+            return 2 + length   # адрес устройства, адрес регистра, данные
+        return 3 + length   # адрес устройства, адрес регистра, повторный старт, адрес устройства, данные
+
+    def transaction_us(self, op: int, length: int) -> float:
+        """Оценка времени транзакции, мкс. 9 тактов на байт (с ACK), START и STOP по такту,
+        повторный START при чтении - еще такт."""
+        clocks = 9 * self.bus_bytes(op, length) + 2 + (0 if is_write(op) else 1)
+        return 1_000_000 * clocks / self.freq + self.overhead_us
+
+
+class RegisterModel:
+    """Модель регистров PCA9685: 256 регистров на каждое устройство, значения которых известны после записи
+    или чтения. Автоинкремент адреса регистра учитывается по биту MODE1.AI (по умолчанию включен,
+    так его настраивает Pca9685.__init__)."""
+
+    def __init__(self):
+        self._regs = dict()    # адрес устройства -> (значения, маска известных значений)
+
+    def _get(self, address: int) -> tuple:
+        if address not in self._regs:
+            self._regs[address] = bytearray(256), bytearray(256)
+        return self._regs[address]
+
+    def _auto_increment(self, address: int) -> bool:
+        val, known = self._get(address)
+        return not known[0] or 0 != 0b0010_0000 & val[0]
+
+    def _addresses(self, address: int, reg: int, length: int) -> list:
+        if self._auto_increment(address):
+            return [(reg + i) & 0xFF for i in range(length)]
+        return [reg] * length
+
+    def redundant_bytes(self, address: int, reg: int, payload: bytes) -> int:
+        """Возвращает количество байт записи, значения которых уже находятся в регистрах"""
+        val, known = self._get(address)
+        cnt = 0
+        for r, b in zip(self._addresses(address, reg, len(payload)), payload):
+            if known[r] and val[r] == b:
+                cnt += 1
+        return cnt
+
+    def apply(self, rec: TraceRecord):
+        """Обновляет модель по записи трассы"""
+        val, known = self._get(rec.address)
+        regs = self._addresses(rec.address, rec.reg, rec.length)
+        for i, r in enumerate(regs):
+            if i < len(rec.payload):
+                val[r] = rec.payload[i]
+                known[r] = 1
+            else:
+                known[r] = 0    # данные обрезаны, значение неизвестно
+
+
+class TraceReport:
+    """Отчет о проигрывании трассы"""
+
+    def __init__(self):
+        self.transactions = 0
+        self.writes = 0
+        self.reads = 0
+        self.payload_bytes = 0
+        self.bus_bytes = 0
+        self.bus_time_us = 0.0
+        self.redundant_writes = 0   # записи, не изменившие ни одного регистра
+        self.redundant_bytes = 0    # байты записей, не изменившие значение регистра
+        self.truncated = 0          # записи с обрезанными данными
+        self.dropped = 0            # записи, потерянные на устройстве
+        self.span_us = 0            # время от первой до последней записи трассы, без пауз записи
+        self.by_op = dict()         # имя операции -> количество
+        self.by_address = dict()    # адрес устройства -> количество транзакций
+
+    def bus_load(self) -> float:
+        """Доля времени занятости шины на интервале трассы, 0..1"""
+        if not self.span_us:
+            return 0.0
+        return min(1.0, self.bus_time_us / self.span_us)
+
+    def __str__(self) -> str:
+        lines = [
+            f"транзакций: {self.transactions} (записей: {self.writes}, чтений: {self.reads})",
+            f"байт данных: {self.payload_bytes}, байт на шине: {self.bus_bytes}",
+            f"время шины: {self.bus_time_us:.1f} мкс, интервал трассы: {self.span_us} мкс, "
+            f"загрузка шины: {100 * self.bus_load():.1f} %",
+            f"избыточных записей: {self.redundant_writes}, избыточных байт: {self.redundant_bytes}",
+            f"обрезанных записей: {self.truncated}, потерянных записей: {self.dropped}",
+        ]
+        lines.extend(f"{name}: {cnt}" for name, cnt in sorted(self.by_op.items()))
+        lines.extend(f"устройство 0x{addr:x}: {cnt}" for addr, cnt in sorted(self.by_address.items()))
+        return "\n".join(lines)
+
+
+def replay(records, cost: BusCostModel = None, device: RegisterModel = None, dropped: int = 0) -> TraceReport:
+    """Проигрывает записи трассы на модели регистров device и модели стоимости шины cost.
+    dropped - количество потерянных на устройстве записей, второй элемент результата load_trace.
+    Возвращает TraceReport."""
+    if cost is None:
+        cost = BusCostModel()
+    if device is None:
+        device = RegisterModel()
+    report = TraceReport()
+    report.dropped = dropped
+    for i, rec in enumerate(records):
+        if i:   # время первой записи отсчитано от записи, которой нет в трассе
+            report.span_us += rec.dt
+        report.transactions += 1
+        report.payload_bytes += rec.length
+        report.bus_bytes += cost.bus_bytes(rec.op, rec.length)
+        report.bus_time_us += cost.transaction_us(rec.op, rec.length)
+        name = _op_names.get(rec.op, str(rec.op))
+        report.by_op[name] = report.by_op.get(name, 0) + 1
+        report.by_address[rec.address] = report.by_address.get(rec.address, 0) + 1
+        truncated = len(rec.payload) < rec.length
+        report.truncated += truncated
+        if is_write(rec.op):
+            report.writes += 1
+            same = device.redundant_bytes(rec.address, rec.reg, rec.payload)
+            report.redundant_bytes += same
+            if not truncated and rec.length and same == rec.length:
+                report.redundant_writes += 1
+        else:
+            report.reads += 1
+        device.apply(rec)
+    return report
+
+
+def replay_file(path: str, cost: BusCostModel = None) -> TraceReport:
+    """Загружает трассу из файла и проигрывает ее"""
+    with open(path, "rb") as f:
+        records, dropped = load_trace(f.read())
+    return replay(records, cost, dropped=dropped)
+
+
+if __name__ == '__main__':
+    import sys
+    for file_name in sys.argv[1:]:
+        print(f"---{file_name}---")
+        print(replay_file(file_name))
@@ -0,0 +1,140 @@
+# micropython
+# mail: goctaprog@gmail.com
+# MIT license
+"""Запись обмена по шине в кольцевой буфер для последующего анализа на ПК (pca9685replay.py)."""
+from sensor_pack import bus_service
+import time
+from micropython import const
+from struct import pack_into, pack
+
+# коды операций в записи трассы
+OP_WRITE_REGISTER = const(1)
+OP_READ_REGISTER = const(2)
+OP_WRITE_BUF = const(3)
+OP_READ_BUF = const(4)
+# заголовок записи: время от предыдущей записи в мкс(I), операция(B), адрес устройства(B), адрес регистра(B),
+# резерв(x), длина данных(H)
+_rec_fmt = "<IBBBxH"
+_rec_header_size = const(10)
+# заголовок трассы: b"P9T", версия(B), макс. длина данных в записи(H), кол-во записей(I), кол-во потерянных записей(I)
+_trace_magic = b"P9T"
+_trace_version = const(2)
+_trace_header_fmt = "<3sBHII"
+
+
+class TracingAdapter(bus_service.BusAdapter):
+    """Посредник, записывающий каждый вызов write_register, read_register, write_buf_to_mem, read_buf_from_mem
+    в кольцевой буфер фиксированного размера и передающий его адаптеру adapter.
+    capacity - количество записей в буфере. При переполнении самые старые записи теряются.
+    payload_cap - максимальное количество сохраняемых байт данных в записи. Более длинные данные обрезаются,
+    но их полная длина сохраняется. Размер буфера: capacity * (10 + payload_cap) байт."""
+
+    def __init__(self, adapter: bus_service.BusAdapter, capacity: int = 256, payload_cap: int = 16):
+        if capacity < 1 or payload_cap not in range(0x10000):
+            raise ValueError(f"Неверные параметры трассы: {capacity}, {payload_cap}")
+        super().__init__(adapter.bus)
+        self.adapter = adapter
+        self._capacity = capacity
+        self._payload_cap = payload_cap
+        self._rec_size = _rec_header_size + payload_cap
+        self._buf = bytearray(capacity * self._rec_size)
+        self._next = 0      # индекс следующей записи
+        self._count = 0     # количество записей в буфере
+        self._dropped = 0   # количество потерянных (перезаписанных) записей
+        self._last_ts = None    # time.ticks_us() предыдущей записи
+        self._enabled = True
+
+    def _record(self, ts: int, op: int, device_addr: int, reg_addr: int, payload):
+        """Добавляет запись в кольцевой буфер.
+        Время хранится как разность с предыдущей записью (time.ticks_diff), поэтому не зависит от периода
+        переполнения счетчика time.ticks_us(), который у разных портов MicroPython разный (2**30 у RP2040, ESP32)."""
+        if not self._enabled:
+            return
+        delta = 0 if self._last_ts is None else max(0, time.ticks_diff(ts, self._last_ts))
+        self._last_ts = ts
+        offs = self._next * self._rec_size
+        length = len(payload)
+        pack_into(_rec_fmt, self._buf, offs, min(delta, 0xFFFF_FFFF), op, device_addr, reg_addr, length)
+        n = min(length, self._payload_cap)
+        if n:
+            start = offs + _rec_header_size
+            memoryview(self._buf)[start:start + n] = memoryview(payload)[:n]
+        self._next = (self._next + 1) % self._capacity
+        if self._count < self._capacity:
+            self._count += 1
+        else:
+            self._dropped += 1
+
+    def write_register(self, device_addr: int, reg_addr: int, value: [int, bytes, bytearray],
+                       bytes_count: int, byte_order: str):
+        ts = time.ticks_us()
+        payload = value.to_bytes(bytes_count, byte_order) if isinstance(value, int) else value
+        self._record(ts, OP_WRITE_REGISTER, device_addr, reg_addr, payload)
+        return self.adapter.write_register(device_addr, reg_addr, value, bytes_count, byte_order)
+
+    def read_register(self, device_addr: int, reg_addr: int, bytes_count: int) -> bytes:
+        ts = time.ticks_us()
+        res = self.adapter.read_register(device_addr, reg_addr, bytes_count)
+        self._record(ts, OP_READ_REGISTER, device_addr, reg_addr, res)
+        return res
+
+    def write_buf_to_mem(self, device_addr: int, mem_addr, buf):
+        ts = time.ticks_us()
+        self._record(ts, OP_WRITE_BUF, device_addr, mem_addr, buf)
+        return self.adapter.write_buf_to_mem(device_addr, mem_addr, buf)
+
+    def read_buf_from_mem(self, device_addr: int, mem_addr, buf):
+        ts = time.ticks_us()
+        res = self.adapter.read_buf_from_mem(device_addr, mem_addr, buf)
+        self._record(ts, OP_READ_BUF, device_addr, mem_addr, buf)
+        return res
+
+    def read(self, device_addr: int, n_bytes: int) -> bytes:
+        return self.adapter.read(device_addr, n_bytes)
+
+    def write(self, device_addr: int, buf: bytes):
+        return self.adapter.write(device_addr, buf)
+
+    def readfrom_into(self, device_addr: int, buf):
+        return self.adapter.readfrom_into(device_addr, buf)
+
+    def __len__(self) -> int:
+        return self._count
+
+    @property
+    def enabled(self) -> bool:
+        """Истина, если вызовы записываются в трассу"""
+        return self._enabled
+
+    @enabled.setter
+    def enabled(self, value: bool):
+        """Включает (Истина) или приостанавливает (Ложь) запись трассы.
+        После включения время первой записи не учитывает паузу (равно 0)."""
+        if value and not self._enabled:
+            self._last_ts = None
+        self._enabled = value
+
+    @property
+    def dropped(self) -> int:
+        """Количество потерянных записей из-за переполнения кольцевого буфера"""
+        return self._dropped
+
+    def clear(self):
+        """Очищает трассу"""
+        self._next = self._count = self._dropped = 0
+        self._last_ts = None
+
+    def dump(self) -> bytes:
+        """Возвращает трассу (заголовок и записи от старой к новой), для сохранения в файл и анализа на ПК"""
+        header = pack(_trace_header_fmt, _trace_magic, _trace_version, self._payload_cap,
+                      self._count, self._dropped)
+        first = (self._next - self._count) % self._capacity
+        size = self._rec_size
+        mv = memoryview(self._buf)
+        if first + self._count <= self._capacity:
+            return header + bytes(mv[first * size:(first + self._count) * size])
+        return header + bytes(mv[first * size:]) + bytes(mv[:self._next * size])
+
+    def save(self, stream):
+        """Записывает трассу в поток stream, например в открытый файл"""
+        stream.write(self.dump())
@@ -0,0 +1,64 @@
+# CPython, pytest
+# mail: goctaprog@gmail.com
+# MIT license
+"""Запуск модулей MicroPython на ПК: минимальные заменители модулей micropython и machine
+и адаптер шины, моделирующий регистры PCA9685."""
+import os
+import sys
+import types
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+if "micropython" not in sys.modules:
+    _mpy = types.ModuleType("micropython")
+    _mpy.const = lambda value: value
+    _mpy.native = lambda func: func
+    sys.modules["micropython"] = _mpy
+
+if "machine" not in sys.modules:
+    _machine = types.ModuleType("machine")
+    for _name in ("I2C", "SPI", "Pin"):
+        setattr(_machine, _name, type(_name, (), {}))
+    sys.modules["machine"] = _machine
+
+import pytest  # noqa: E402
+from sensor_pack.bus_service import BusAdapter  # noqa: E402
+
+
+class RegisterBusAdapter(BusAdapter):
+    """Адаптер шины с 256 регистрами на каждое устройство и автоинкрементом адреса регистра"""
+
+    def __init__(self):
+        super().__init__(None)
+        self.mem = dict()
+        self.writes = 0
+
+    def regs(self, device_addr: int) -> bytearray:
+        return self.mem.setdefault(device_addr, bytearray(256))
+
+    def _store(self, device_addr: int, reg_addr: int, buf):
+        regs = self.regs(device_addr)
+        for i, b in enumerate(bytes(buf)):
+            regs[(reg_addr + i) & 0xFF] = b
+        self.writes += 1
+
+    def write_register(self, device_addr, reg_addr, value, bytes_count, byte_order):
+        buf = value.to_bytes(bytes_count, byte_order) if isinstance(value, int) else value
+        self._store(device_addr, reg_addr, buf)
+
+    def read_register(self, device_addr, reg_addr, bytes_count) -> bytes:
+        regs = self.regs(device_addr)
+        return bytes(regs[(reg_addr + i) & 0xFF] for i in range(bytes_count))
+
+    def write_buf_to_mem(self, device_addr, mem_addr, buf):
+        self._store(device_addr, mem_addr, buf)
+
+    def read_buf_from_mem(self, device_addr, mem_addr, buf):
+        regs = self.regs(device_addr)
+        for i in range(len(buf)):
+            buf[i] = regs[(mem_addr + i) & 0xFF]
+
+
+@pytest.fixture
+def adapter():
+    return RegisterBusAdapter()
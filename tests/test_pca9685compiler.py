@@ -0,0 +1,97 @@
+# CPython, pytest
+# mail: goctaprog@gmail.com
+# MIT license
+"""Совместимость формата потока кадров pca9685compiler.py и Pca9685.play_frame"""
+import io
+import struct
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+import pca9685compiler  # noqa: E402
+import pca9685mod  # noqa: E402
+
+
+def _show(n_frames: int = 60, n_channels: int = 40):
+    """Шоу со случайными, редко меняющимися яркостями, полностью включенными и выключенными кадрами"""
+    rng = np.random.default_rng(7)
+    keys = rng.random((n_frames // 4 + 1, n_channels))
+    frames = np.repeat(keys, 4, axis=0)[:n_frames]
+    frames[5] = 1.0
+    frames[6] = 0.0
+    mapping = [(0x40 + c // 16, (7 * c) % 16) for c in range(n_channels)]
+    return frames, mapping
+
+
+def _expected_regs(on: np.ndarray, off: np.ndarray, frame: int, col: int) -> bytes:
+    return struct.pack("<HH", int(on[frame, col]), int(off[frame, col]))
+
+
+def test_stream_header_matches_device():
+    assert pca9685compiler._stream_magic == pca9685mod._stream_magic
+    assert pca9685compiler._stream_version == pca9685mod._stream_version
+    assert pca9685compiler._stream_header_fmt == pca9685mod._stream_header_fmt
+    assert struct.calcsize(pca9685mod._stream_header_fmt) == pca9685mod._stream_header_size
+
+
+@pytest.mark.parametrize("curve", [None, 2.2, 2, np.float32(2.2), np.int64(2), "per_channel"])
+def test_round_trip(adapter, curve):
+    frames, mapping = _show()
+    phase = np.arange(frames.shape[1]) * 97
+    if "per_channel" == curve:
+        curve = np.linspace(0.0, 1.0, 5)[None, :] ** np.linspace(1.0, 3.0, frames.shape[1])[:, None]
+    streams = pca9685compiler.compile_show(frames, mapping, curve=curve, phase=phase, frame_period=20)
+    on, off = pca9685compiler.quantize(pca9685compiler.apply_curve(frames, curve), phase)
+    assert sorted(streams) == [0x40, 0x41, 0x42]
+    for address, data in streams.items():
+        controller = pca9685mod.Pca9685(adapter, address)
+        stream = io.BytesIO(data)
+        assert pca9685mod.read_stream_header(stream) == (address, 20, frames.shape[0])
+        regs = adapter.regs(address)
+        for frame in range(frames.shape[0]):
+            assert controller.play_frame(stream)
+            for col, (chip, led) in enumerate(mapping):
+                if chip == address:
+                    offs = 6 + 4 * led
+                    assert bytes(regs[offs:offs + 4]) == _expected_regs(on, off, frame, col)
+        assert not controller.play_frame(stream)
+
+
+def test_unchanged_frames_write_nothing(adapter):
+    frames = np.full((10, 16), 0.5)
+    streams = pca9685compiler.compile_show(frames, [(0x40, i) for i in range(16)])
+    controller = pca9685mod.Pca9685(adapter)
+    stream = io.BytesIO(streams[0x40])
+    pca9685mod.read_stream_header(stream)
+    writes = adapter.writes
+    controller.play_frame(stream)
+    assert adapter.writes == writes + 1     # первый кадр - один участок из 16 выходов
+    while controller.play_frame(stream):
+        pass
+    assert adapter.writes == writes + 1
+
+
+def test_truncated_stream(adapter):
+    frames, mapping = _show(8, 16)
+    data = pca9685compiler.compile_show(frames, mapping)[0x40]
+    controller = pca9685mod.Pca9685(adapter)
+    stream = io.BytesIO(data[:-3])
+    pca9685mod.read_stream_header(stream)
+    with pytest.raises(ValueError):
+        while controller.play_frame(stream):
+            pass
+
+
+def test_invalid_run(adapter):
+    controller = pca9685mod.Pca9685(adapter)
+    for run in (b"\x01\x00\x00", b"\x01\x0f\x02" + bytes(8), b"\x01\x00\x11" + bytes(68)):
+        with pytest.raises(ValueError):
+            controller.play_frame(io.BytesIO(run))
+
+
+def test_invalid_show():
+    with pytest.raises(ValueError):
+        pca9685compiler.compile_show(np.zeros((0, 2)), [(0x40, 0), (0x40, 1)])
+    with pytest.raises(ValueError):
+        pca9685compiler.compile_show(np.zeros((3, 2)), [(0x40, 0), (0x40, 1)], curve=np.ones((2, 1)))
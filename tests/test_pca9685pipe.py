@@ -0,0 +1,111 @@
+# CPython, pytest
+# mail: goctaprog@gmail.com
+# MIT license
+"""Конвейер вывода кадров pca9685pipe.OutputPipeline"""
+import time
+
+import pytest
+
+import pca9685mod
+import pca9685pipe
+
+_addresses = 0x40, 0x41, 0x42
+
+
+def _controllers(adapter):
+    return [pca9685mod.Pca9685(adapter, address) for address in _addresses]
+
+
+def _render(pipe, frame: int):
+    for chip in range(len(pipe)):
+        for index in range(16):
+            pipe.set_out(chip, index, (frame + 7 * chip + index) % 101)
+
+
+@pytest.mark.parametrize("policy", [pca9685pipe.POLICY_WAIT, pca9685pipe.POLICY_DROP, pca9685pipe.POLICY_LATEST])
+def test_final_frame_reaches_all_chips(adapter, policy):
+    write = adapter.write_buf_to_mem
+
+    def slow_write(device_addr, mem_addr, buf):
+        time.sleep(0.0005)
+        write(device_addr, mem_addr, buf)
+
+    adapter.write_buf_to_mem = slow_write
+    controllers = _controllers(adapter)
+    pipe = pca9685pipe.OutputPipeline(controllers, policy)
+    pipe.start()
+    frames = 50
+    for frame in range(frames):
+        _render(pipe, frame)
+        pipe.submit()
+    if pca9685pipe.POLICY_DROP == policy:
+        while not pipe.submit():    # последний кадр мог быть отброшен
+            time.sleep(0.001)
+    pipe.stop()
+    assert pipe.submitted + pipe.dropped >= frames
+    if pca9685pipe.POLICY_WAIT == policy:
+        assert frames == pipe.sent
+    for chip, address in enumerate(_addresses):
+        expected = bytearray(64)
+        for index in range(16):
+            pca9685mod.pack_out(expected, 4 * index, *pca9685mod.get_on_off((frames - 1 + 7 * chip + index) % 101))
+        assert expected == adapter.regs(address)[6:6 + 64]
+
+
+def test_only_changed_span_is_written(adapter):
+    calls = list()
+    write = adapter.write_buf_to_mem
+    adapter.write_buf_to_mem = lambda device_addr, mem_addr, buf: (calls.append((device_addr, mem_addr, len(buf))),
+                                                                    write(device_addr, mem_addr, buf))
+    pipe = pca9685pipe.OutputPipeline(_controllers(adapter), pca9685pipe.POLICY_WAIT)
+    pipe.start()
+    pipe.submit()   # все выходы всех контроллеров
+    while pipe.sent < 1:
+        time.sleep(0.001)
+    calls.clear()
+    pipe.set_out(1, 3, 50)
+    pipe.set_out(1, 5, 50)
+    pipe.set_out(2, 0, 0)     # значение не изменилось
+    pipe.submit()
+    pipe.stop()
+    assert [(0x41, 6 + 4 * 3, 12)] == calls
+
+
+def test_worker_error_raised_by_stop(adapter):
+    def broken_write(device_addr, mem_addr, buf):
+        raise OSError("нет ответа устройства")
+
+    controllers = _controllers(adapter)
+    adapter.write_buf_to_mem = broken_write
+    pipe = pca9685pipe.OutputPipeline(controllers)
+    pipe.start()
+    pipe.submit()
+    with pytest.raises(RuntimeError):
+        pipe.stop()
+    assert isinstance(pipe.error, OSError)
+    with pytest.raises(RuntimeError):
+        pipe.submit()
+
+
+def test_invalid_index(adapter):
+    pipe = pca9685pipe.OutputPipeline(_controllers(adapter))
+    for chip, index in ((0, -1), (0, 16), (-1, 0), (3, 0)):
+        with pytest.raises(ValueError):
+            pipe.set_out(chip, index, 50)
+
+
+def test_waiting_producer_wakes_on_worker_error(adapter):
+    def broken_write(device_addr, mem_addr, buf):
+        time.sleep(0.002)
+        raise OSError("нет ответа устройства")
+
+    controllers = _controllers(adapter)
+    adapter.write_buf_to_mem = broken_write
+    pipe = pca9685pipe.OutputPipeline(controllers, pca9685pipe.POLICY_WAIT)
+    pipe.start()
+    with pytest.raises(RuntimeError):
+        for frame in range(10):
+            _render(pipe, frame)
+            pipe.submit()
+    with pytest.raises(RuntimeError):
+        pipe.stop()
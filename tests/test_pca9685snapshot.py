@@ -0,0 +1,133 @@
+# CPython, pytest
+# mail: goctaprog@gmail.com
+# MIT license
+"""Снимок состояния Pca9685.snapshot и его восстановление Pca9685.restore"""
+import time
+
+import pytest
+
+import pca9685mod
+from conftest import RegisterBusAdapter
+
+_mode1_reset = 0x11     # MODE1 после сброса: сон, ALLCALL, автоинкремент выключен
+
+
+class _AutoIncrementAdapter(RegisterBusAdapter):
+    """Без бита MODE1.AI все байты пакетного чтения и записи относятся к одному регистру, как у PCA9685"""
+
+    def _ai(self, device_addr: int) -> bool:
+        return 0 != 0b0010_0000 & self.regs(device_addr)[0]
+
+    def _store(self, device_addr, reg_addr, buf):
+        if 1 < len(buf) and not self._ai(device_addr):
+            buf = bytes(buf)[-1:]
+        super()._store(device_addr, reg_addr, buf)
+
+    def read_buf_from_mem(self, device_addr, mem_addr, buf):
+        if self._ai(device_addr):
+            return super().read_buf_from_mem(device_addr, mem_addr, buf)
+        for i in range(len(buf)):
+            buf[i] = self.regs(device_addr)[mem_addr]
+
+
+class _LoggingAdapter(_AutoIncrementAdapter):
+    def __init__(self):
+        super().__init__()
+        self.log = list()
+
+    def _store(self, device_addr, reg_addr, buf):
+        self.log.append((reg_addr, bytes(buf)))
+        super()._store(device_addr, reg_addr, buf)
+
+
+@pytest.fixture(autouse=True)
+def sleep_us(monkeypatch):
+    monkeypatch.setattr(time, "sleep_us", lambda us: None, raising=False)
+
+
+def _configured(adapter) -> pca9685mod.Pca9685:
+    controller = pca9685mod.Pca9685(adapter)
+    controller.set_pwm_freq(200)
+    controller.set_sub_addr(1, 0x55)
+    controller.configure_led_out(inverted=True, open_drain=True)
+    for index in range(16):
+        controller[index] = 6 * index
+    return controller
+
+
+def _fresh(adapter, address: int = 0x40):
+    """Состояние регистров после сброса микросхемы"""
+    regs = adapter.regs(address)
+    regs[:] = bytes(256)
+    regs[0] = _mode1_reset
+    regs[0xFE] = 0x1E
+
+
+def test_round_trip():
+    adapter = _AutoIncrementAdapter()
+    controller = _configured(adapter)
+    snap = controller.snapshot()
+    assert 75 == len(snap) and snap.startswith(b"P9S")
+    expected = bytes(adapter.regs(0x40))
+    _fresh(adapter)
+    controller.restore(snap)
+    regs = adapter.regs(0x40)
+    assert expected[:0x46] == regs[:0x46]
+    assert expected[0xFE] == regs[0xFE]
+
+
+def test_write_sequence():
+    adapter = _LoggingAdapter()
+    controller = _configured(adapter)
+    snap = controller.snapshot()
+    _fresh(adapter)
+    adapter.log.clear()
+    controller.restore(snap)
+    mode_1 = snap[4] & 0x7F
+    assert [(0x00, b"\x30"), (0x01, snap[5:4 + 0x46]), (0xFE, snap[-1:]), (0x00, bytes([mode_1]))] == adapter.log
+
+
+def test_external_clock():
+    adapter = _LoggingAdapter()
+    controller = _configured(adapter)
+    snap = bytearray(controller.snapshot())
+    snap[4] |= 0b0100_0000     # EXTCLK
+    _fresh(adapter)
+    adapter.log.clear()
+    controller.restore(snap)
+    assert [0x30, 0x70] == [adapter.log[0][1][0], adapter.log[1][1][0]]   # сон, затем сон + EXTCLK
+    assert 5 == len(adapter.log)
+    assert snap[4] & 0x7F == adapter.regs(0x40)[0]
+
+
+def test_snapshot_keeps_auto_increment_off():
+    adapter = _AutoIncrementAdapter()
+    controller = _configured(adapter)
+    expected = bytes(adapter.regs(0x40))
+    adapter.regs(0x40)[0] = 0x01
+    snap = controller.snapshot()
+    assert 0x01 == snap[4] == adapter.regs(0x40)[0]
+    assert expected[1:0x46] == snap[5:4 + 0x46]
+
+
+@pytest.mark.parametrize("offset, value", [
+    (None, None),       # неверный размер
+    (0, ord("X")),      # заголовок
+    (3, 2),             # версия
+    (4 + 0x46, 0),      # PRE_SCALE < 3
+    (4 + 1, 0x80),      # зарезервированные биты MODE2
+    (4 + 3, 0x01),      # зарезервированный бит SUBADR2
+    (4 + 7, 0x20),      # зарезервированные биты LED0_ON_H
+])
+def test_invalid_snapshot_writes_nothing(offset, value):
+    adapter = _LoggingAdapter()
+    controller = _configured(adapter)
+    snap = bytearray(controller.snapshot())
+    if offset is None:
+        snap = snap[:-1]
+    else:
+        snap[offset] = value
+    adapter.log.clear()
+    with pytest.raises(ValueError):
+        controller.restore(snap)
+    assert [] == adapter.log
@@ -0,0 +1,95 @@
+# CPython, pytest
+# mail: goctaprog@gmail.com
+# MIT license
+"""Запись трассы обмена pca9685trace.TracingAdapter и ее анализ pca9685replay"""
+import time
+
+import pytest
+
+import pca9685mod
+import pca9685replay
+from pca9685trace import TracingAdapter
+
+_period = 2 ** 30     # период переполнения time.ticks_us() у RP2040 и ESP32
+
+
+class _Ticks:
+    """Счетчик мкс с переполнением, как time.ticks_us() в MicroPython"""
+
+    def __init__(self, start: int):
+        self.now = start
+
+    def ticks_us(self) -> int:
+        return self.now % _period
+
+    @staticmethod
+    def ticks_diff(end: int, start: int) -> int:
+        return ((end - start + _period // 2) % _period) - _period // 2
+
+
+@pytest.fixture
+def ticks(monkeypatch):
+    clock = _Ticks(_period - 10)
+    monkeypatch.setattr(time, "ticks_us", clock.ticks_us, raising=False)
+    monkeypatch.setattr(time, "ticks_diff", clock.ticks_diff, raising=False)
+    return clock
+
+
+def test_span_across_ticks_wrap(adapter, ticks):
+    tracer = TracingAdapter(adapter)
+    tracer.write_register(0x40, 0x06, 1, 1, "little")
+    ticks.now += 15
+    tracer.write_register(0x40, 0x06, 1, 1, "little")
+    records, dropped = pca9685replay.load_trace(tracer.dump())
+    report = pca9685replay.replay(records, dropped=dropped)
+    assert 15 == report.span_us
+    assert 1 == report.redundant_writes
+
+
+def test_dropped_records(adapter, ticks):
+    tracer = TracingAdapter(adapter, capacity=7, payload_cap=2)
+    controller = pca9685mod.Pca9685(tracer)
+    for index in range(16):
+        controller[index] = index
+        ticks.now += 100
+    records, dropped = pca9685replay.load_trace(tracer.dump())
+    assert 7 == len(records)
+    assert tracer.dropped == dropped > 0
+    assert [0x2A + 4 * i for i in range(7)] == [rec.reg for rec in records]
+    report = pca9685replay.replay(records, dropped=dropped)
+    assert dropped == report.dropped
+    assert 7 == report.truncated
+    assert 600 == report.span_us
+
+
+def test_forwarding(adapter, ticks):
+    calls = list()
+    adapter.readfrom_into = lambda device_addr, buf: calls.append((device_addr, len(buf)))
+    tracer = TracingAdapter(adapter)
+    tracer.readfrom_into(0x40, bytearray(3))
+    assert [(0x40, 3)] == calls
+    assert 0 == len(tracer)
+
+
+def test_pause_not_counted(adapter, ticks):
+    tracer = TracingAdapter(adapter)
+    tracer.write_register(0x40, 0x06, 1, 1, "little")
+    ticks.now += 10
+    tracer.write_register(0x40, 0x06, 2, 1, "little")
+    tracer.enabled = False
+    ticks.now += 1_000_000
+    tracer.write_register(0x40, 0x06, 3, 1, "little")
+    tracer.enabled = True
+    ticks.now += 50
+    tracer.write_register(0x40, 0x06, 4, 1, "little")
+    ticks.now += 20
+    tracer.write_register(0x40, 0x06, 5, 1, "little")
+    records, dropped = pca9685replay.load_trace(tracer.dump())
+    assert [0, 10, 0, 20] == [rec.dt for rec in records]
+    assert 30 == pca9685replay.replay(records).span_us
+
+
+def test_short_trace():
+    for data in (b"", b"P9T\x02"):
+        with pytest.raises(ValueError):
+            pca9685replay.load_trace(data)